@@ -5,9 +5,13 @@ Replaces problematic characters in filenames with safe alternatives.
 Works on both Windows and WSL/Linux.
 """
 
+import errno
 import os
+import re
 import sys
-import argparse
+import functools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Character replacement mapping
@@ -29,10 +33,10 @@ CHAR_MAP = {
     '|': '_',
     '｜': '_',  # Fullwidth vertical bar
     '"': '_',
-    '"': '_',  # Left double quotation mark
-    '"': '_',  # Right double quotation mark
-    ''': '_',  # Left single quotation mark
-    ''': '_',  # Right single quotation mark (apostrophe)
+    '\u201c': '_',  # Left double quotation mark
+    '\u201d': '_',  # Right double quotation mark
+    '\u2018': '_',  # Left single quotation mark
+    '\u2019': '_',  # Right single quotation mark (apostrophe)
     '*': '_',
     '＊': '_',  # Fullwidth asterisk
     '/': '_',
@@ -41,65 +45,365 @@ CHAR_MAP = {
     '＼': '_'  # Fullwidth backslash
 }
 
-def sanitize_filename(filename):
-    """Replace problematic characters in filename according to CHAR_MAP."""
-    for old_char, new_char in CHAR_MAP.items():
-        filename = filename.replace(old_char, new_char)
+# Translation table and collapse pattern, built once at import
+_TRANS_TABLE = str.maketrans(CHAR_MAP)
+_COLLAPSE_RE = re.compile(r'([-_])\1+')
+# Matches anything sanitize_filename would change; clean names skip the work
+_BAD_RE = re.compile('[' + re.escape(''.join(CHAR_MAP)) + ']|--|__')
+
+@functools.lru_cache(maxsize=8192)
+def sanitize_filename(filename, _bad=_BAD_RE, _table=_TRANS_TABLE, _collapse=_COLLAPSE_RE):
+    """
+    Replace problematic characters in filename according to CHAR_MAP.
+    
+    The precompiled tables are bound as default arguments so lookups in
+    this hot function are locals rather than module globals.
+    """
+    if _bad.search(filename) is None:
+        return filename
+    
+    filename = filename.translate(_table)
     
     # Remove multiple consecutive dashes or underscores
-    while '--' in filename:
-        filename = filename.replace('--', '-')
-    while '__' in filename:
-        filename = filename.replace('__', '_')
+    filename = _collapse.sub(r'\1', filename)
     
     return filename
 
+# Verbose output lines are buffered and written to stdout in chunks of this size
+_OUTPUT_CHUNK = 256
+
+# Whether renames can be issued relative to an open directory descriptor
+_DIR_FD_SUPPORTED = {os.rename, os.stat} <= os.supports_dir_fd
+
+# Directory listings and per-name high-water counters used by
+# get_alternative_filename, cleared after each batch
+_dir_listing_cache = {}
+_alt_counter_cache = {}
+
+def _dir_listing(dirpath):
+    """
+    Return the cached set of entry names in dirpath, reading it on first use.
+    
+    A directory that cannot be listed (e.g. write-only) yields an empty set;
+    callers confirm candidates with os.path.lexists.
+    """
+    names = _dir_listing_cache.get(dirpath)
+    if names is None:
+        try:
+            with os.scandir(dirpath) as entries:
+                names = {entry.name for entry in entries}
+        except OSError:
+            names = set()
+        _dir_listing_cache[dirpath] = names
+    return names
+
+def _clear_dir_caches():
+    """Forget cached directory listings and counters at the end of a batch."""
+    _dir_listing_cache.clear()
+    _alt_counter_cache.clear()
+
 def get_alternative_filename(path, base_name):
-    """Generate alternative filename if conflict exists."""
-    counter = 1
+    """
+    Generate alternative filename if conflict exists.
+    
+    The counter is one past the highest existing "<name>_<n>[.ext]" in the
+    parent directory, found with a single pass over a cached listing and
+    then tracked per name, so repeated conflicts do not rescan. The chosen
+    name is confirmed with os.path.lexists in case the listing was missing.
+    """
+    dirpath = str(path.parent)
     name_parts = base_name.rsplit('.', 1)
     
     if len(name_parts) == 2:
         name, ext = name_parts
-        while (path.parent / f"{name}_{counter}.{ext}").exists():
-            counter += 1
-        return f"{name}_{counter}.{ext}"
+        suffix = f".{ext}"
     else:
-        while (path.parent / f"{base_name}_{counter}").exists():
-            counter += 1
-        return f"{base_name}_{counter}"
+        name, suffix = base_name, ""
+    
+    key = (dirpath, name, suffix)
+    highest = _alt_counter_cache.get(key)
+    if highest is None:
+        # Ignore case so names that collide on NTFS/APFS are counted too
+        pattern = re.compile(rf'{re.escape(name)}_([0-9]+){re.escape(suffix)}', re.IGNORECASE)
+        highest = max(
+            (int(m.group(1)) for n in _dir_listing(dirpath) if (m := pattern.fullmatch(n))),
+            default=0
+        )
+    
+    highest += 1
+    while os.path.lexists(os.path.join(dirpath, f"{name}_{highest}{suffix}")):
+        highest += 1
+    _alt_counter_cache[key] = highest
+    return f"{name}_{highest}{suffix}"
 
 def get_user_confirmation(prompt):
     """Get Y/n confirmation from user."""
-    import sys
+    while True:
+        # Always display the prompt message first
+        print(f"{prompt} (Y/n): ", end='', flush=True)
+        
+        try:
+            response = input().strip().lower()
+        except (EOFError, KeyboardInterrupt):
+            # In batch/drag-drop context, auto-confirm
+            print("Y")
+            return True
+        
+        if response in ('', 'y', 'yes'):
+            return True
+        elif response in ('n', 'no'):
+            return False
+        print("Please enter Y/y/yes or N/n/no (or press Enter for Yes)")
+
+def _iter_files(root, recursive=False, onerror=None):
+    """
+    Yield (parent_dir, name) string tuples for files under root.
     
-    # Always display the prompt message first
-    print(f"{prompt} (Y/n): ", end='', flush=True)
+    Uses os.scandir so entries are classified from the cached directory
+    listing rather than a stat per Path. Subdirectories are walked with an
+    explicit stack when recursive is set; symlinks are not followed. Parent
+    directory strings are interned so every entry of a directory shares one.
+    Subdirectories that cannot be read are skipped; as with os.walk, the
+    OSError is passed to onerror if given. An unreadable root still raises.
+    """
+    if root.is_file():
+        yield sys.intern(str(root.parent)), root.name
+        return
     
+    root_path = str(root)
+    stack = [root_path]
+    while stack:
+        dirpath = sys.intern(stack.pop())
+        try:
+            entries = os.scandir(dirpath)
+        except OSError as e:
+            if dirpath == root_path:
+                raise
+            if onerror is not None:
+                onerror(e)
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    yield dirpath, entry.name
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+
+def _write_lines(lines):
+    """Write buffered output lines to stdout in one call and clear the buffer."""
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+        lines.clear()
+
+def _warn_unreadable(out, error):
+    """Flush buffered output, then report a directory the walk skipped."""
+    _write_lines(out)
+    print(f"  Warning: Skipping unreadable directory '{error.filename}': {error}")
+
+def _plan_renames(path, recursive=False, onerror=None):
+    """
+    Yield (parent_dir, old_name, new_name) for files whose names change.
+    
+    Entries are produced lazily as the walk proceeds, grouped by directory.
+    Storing the shared parent plus two names keeps the plan compact; full
+    paths are joined only when needed, and Path objects only for conflicts.
+    
+    Args:
+        path: Directory or file path to process
+        recursive: Process subdirectories recursively
+        onerror: Called with the OSError for each subdirectory skipped
+    """
+    for parent, old_name in _iter_files(path, recursive, onerror):
+        new_name = sanitize_filename(old_name)
+        if old_name != new_name:
+            yield parent, old_name, new_name
+
+def _lexists(path, dir_fd=None):
+    """os.path.lexists that also accepts a path relative to dir_fd."""
     try:
-        response = input().strip().lower()
-        if response in ['', 'y', 'yes']:
-            return True
-        elif response in ['n', 'no']:
-            return False
+        os.stat(path, dir_fd=dir_fd, follow_symlinks=False)
+    except OSError:
+        return False
+    return True
+
+def _rename_no_replace(src, dst, dir_fd=None):
+    """
+    Rename src to dst, raising FileExistsError instead of overwriting.
+    
+    Windows os.rename already refuses to replace an existing file, so no
+    check is needed there. POSIX os.rename silently replaces the target, so
+    the target is checked first. When dir_fd is given, src and dst are names
+    relative to that open directory.
+    """
+    if os.name != 'nt' and _lexists(dst, dir_fd):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+    os.rename(src, dst, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+
+def _rename_group(dirpath, pairs):
+    """
+    Rename (old_name, new_name) pairs within one directory, in order.
+    
+    Where the platform supports it the directory is opened once and each
+    rename is done relative to that descriptor, so the directory path is
+    resolved once per group rather than once per file.
+    
+    Returns:
+        List of (old_name, new_name, error) tuples for renames that failed
+    """
+    dir_fd = None
+    if _DIR_FD_SUPPORTED:
+        try:
+            dir_fd = os.open(dirpath, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+        except OSError:
+            dir_fd = None
+    
+    failures = []
+    try:
+        for old_name, new_name in pairs:
+            try:
+                if dir_fd is None:
+                    _rename_no_replace(os.path.join(dirpath, old_name), os.path.join(dirpath, new_name))
+                else:
+                    _rename_no_replace(old_name, new_name, dir_fd)
+            except Exception as e:
+                failures.append((old_name, new_name, e))
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+    return failures
+
+def _try_alternative(file_path, new_name):
+    """
+    Offer an alternative name for a conflicting rename and apply it if accepted.
+    
+    Returns:
+        True if the file was renamed
+    """
+    alternative_name = get_alternative_filename(file_path, new_name)
+    if not get_user_confirmation(f"Try alternative name '{alternative_name}'?"):
+        return False
+    try:
+        _rename_no_replace(str(file_path), str(file_path.parent / alternative_name))
+    except Exception as e:
+        print(f"  Error with alternative name: {e}")
+        return False
+    print(f"  Successfully renamed to: {alternative_name}")
+    return True
+
+def _apply_plan(plan, verbose=True, mark_first=False, serial=False, out=None):
+    """
+    Rename files according to a plan from _plan_renames.
+    
+    The plan is consumed as a stream: each run of entries sharing a parent
+    directory is submitted to a thread pool as soon as it is complete, which
+    overlaps per-call latency on network filesystems. Collisions within a
+    directory are caught from the set of planned targets; collisions with
+    files already on disk surface as FileExistsError from the rename itself.
+    Alternative names are offered once all renames have finished.
+    
+    Args:
+        plan: Iterable of (parent_dir, old_name, new_name), grouped by directory
+        verbose: Print detailed output
+        mark_first: Prefix the first output line with "== "
+        serial: Rename one file at a time instead of using a thread pool
+        out: Output buffer, shared with the plan's onerror so its warnings
+            stay in order
+    
+    Returns:
+        Number of files renamed
+    """
+    plan = iter(plan)
+    if out is None:
+        out = []
+    files_renamed = 0
+    conflicts = []
+    failures = []
+    futures = []
+    
+    executor = None
+    if not serial:
+        executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4))
+    
+    group_dir = None
+    group = []
+    planned_dsts = set()
+    
+    try:
+        while True:
+            # A walk error stops planning; renames already submitted still
+            # complete and are reported, and conflicts are still offered
+            try:
+                entry = next(plan, None)
+            except OSError as e:
+                _write_lines(out)
+                print(f"  Error reading directory: {e}")
+                entry = None
+            
+            if entry is None or entry[0] != group_dir:
+                if group:
+                    files_renamed += len(group)
+                    if executor is None:
+                        failures.extend((group_dir, *f) for f in _rename_group(group_dir, group))
+                    else:
+                        futures.append((group_dir, executor.submit(_rename_group, group_dir, group)))
+                if entry is None:
+                    break
+                group_dir = entry[0]
+                group = []
+                planned_dsts = set()
+            
+            _, old_name, new_name = entry
+            if verbose:
+                prefix = "== " if mark_first else ""
+                mark_first = False
+                out.append(f"{prefix}Renaming: {old_name} -> {new_name}")
+                if len(out) >= _OUTPUT_CHUNK:
+                    _write_lines(out)
+            
+            if new_name in planned_dsts:
+                conflicts.append((Path(group_dir, old_name), new_name))
+                continue
+            
+            planned_dsts.add(new_name)
+            group.append((old_name, new_name))
+        
+        _write_lines(out)
+        for dirpath, future in futures:
+            failures.extend((dirpath, *f) for f in future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    
+    files_renamed -= len(failures)
+    
+    for dirpath, old_name, new_name, e in failures:
+        if isinstance(e, FileExistsError):
+            conflicts.append((Path(dirpath, old_name), new_name))
         else:
-            print("Please enter Y/y/yes or N/n/no (or press Enter for Yes)")
-            return get_user_confirmation(prompt)
-    except (EOFError, KeyboardInterrupt):
-        # In batch/drag-drop context, auto-confirm
-        print("Y")
-        return True
+            print(f"  Error renaming '{os.path.join(dirpath, old_name)}': {e}")
+    
+    for file_path, new_name in conflicts:
+        print(f"  Warning: '{new_name}' already exists.")
+        if _try_alternative(file_path, new_name):
+            files_renamed += 1
+    
+    _clear_dir_caches()
+    return files_renamed
 
-def rename_files(path, recursive=False, dry_run=True, verbose=True, first_call=True):
+def rename_files(path, recursive=False, dry_run=True, verbose=True, serial=False):
     """
     Rename files in the specified path.
     
+    The directory is walked once. A wet run renames files as the walk
+    produces them; a dry run prints and keeps the plan and, on
+    confirmation, applies that same plan.
+    
     Args:
         path: Directory path to process
         recursive: Process subdirectories recursively
         dry_run: Show what would be renamed without actually renaming
         verbose: Print detailed output
-        first_call: Whether this is the first call (for "== " prefix)
+        serial: Rename one file at a time instead of using a thread pool
     """
     path = Path(path)
     
@@ -107,101 +411,72 @@ def rename_files(path, recursive=False, dry_run=True, verbose=True, first_call=T
         print(f"Error: Path '{path}' does not exist.")
         return
     
-    files_renamed = 0
-    first_output = True
+    if not dry_run:
+        out = []
+        plan = _plan_renames(path, recursive, functools.partial(_warn_unreadable, out))
+        files_renamed = _apply_plan(plan, verbose, mark_first=True, serial=serial, out=out)
+        if verbose:
+            print(f"Complete. {files_renamed} files renamed.")
+        return
     
-    # Get files to process
-    if path.is_file():
-        files_to_process = [path]
-    elif recursive:
-        files_to_process = [f for f in path.rglob('*') if f.is_file()]
-    else:
-        files_to_process = [f for f in path.iterdir() if f.is_file()]
+    if not verbose:
+        return
     
-    for file_path in files_to_process:
-        old_name = file_path.name
-        new_name = sanitize_filename(old_name)
+    # The dry run keeps the plan so a confirmed run can apply it without
+    # walking the tree again; entries are printed as they are found
+    plan = []
+    out = []
+    prefix = "== "
+    listing_dir = None
+    for entry in _plan_renames(path, recursive, functools.partial(_warn_unreadable, out)):
+        plan.append(entry)
+        parent, old_name, new_name = entry
+        out.append(f"{prefix}[DRY RUN] Renaming: {old_name} -> {new_name}")
+        prefix = ""
         
-        if old_name != new_name:
-            new_path = file_path.parent / new_name
-            
-            if verbose:
-                prefix = "== " if first_call and first_output else ""
-                first_output = False
-                print(f"{prefix}{'[DRY RUN] ' if dry_run else ''}Renaming: {old_name} -> {new_name}")
-            
-            if not dry_run:
-                # Check if target already exists
-                if new_path.exists():
-                    print(f"  Warning: '{new_name}' already exists.")
-                    alternative_name = get_alternative_filename(file_path, new_name)
-                    if get_user_confirmation(f"Try alternative name '{alternative_name}'?"):
-                        try:
-                            alternative_path = file_path.parent / alternative_name
-                            file_path.rename(alternative_path)
-                            files_renamed += 1
-                            print(f"  Successfully renamed to: {alternative_name}")
-                        except Exception as e:
-                            print(f"  Error with alternative name: {e}")
-                    continue
-                
-                try:
-                    file_path.rename(new_path)
-                    files_renamed += 1
-                except Exception as e:
-                    print(f"  Error renaming '{old_name}': {e}")
-                    
-                    # If it's a file exists error, offer alternative naming
-                    if "exists" in str(e).lower() or "cannot create" in str(e).lower():
-                        alternative_name = get_alternative_filename(file_path, new_name)
-                        if get_user_confirmation(f"Try alternative name '{alternative_name}'?"):
-                            try:
-                                alternative_path = file_path.parent / alternative_name
-                                file_path.rename(alternative_path)
-                                files_renamed += 1
-                                print(f"  Successfully renamed to: {alternative_name}")
-                            except Exception as e2:
-                                print(f"  Error with alternative name: {e2}")
-            else:
-                # In dry-run mode, count the file unless target exists
-                if not new_path.exists():
-                    files_renamed += 1
-                elif verbose:
-                    print(f"  Warning: '{new_name}' already exists. Would skip.")
-                    # Suggest alternative filename in dry-run mode
-                    alternative_name = get_alternative_filename(file_path, new_name)
-                    print(f"  Alternative name would be: '{alternative_name}'")
-                    # Count this as a file that could be renamed (with alternative name)
-                    files_renamed += 1
-    
-    if verbose:
-        if dry_run:
-            print(f"Dry run complete. {files_renamed} files would be renamed.")
-            if files_renamed > 0:
-                if get_user_confirmation("Proceed with renaming these files?"):
-                    # Recursively call with wet run
-                    rename_files(path, recursive, dry_run=False, verbose=verbose, first_call=False)
-        else:
+        # The plan is grouped by directory, so caches from get_alternative_filename
+        # are only needed for the current one
+        if parent != listing_dir:
+            _clear_dir_caches()
+            listing_dir = parent
+        
+        # Ask the filesystem, which also decides whether names differing only
+        # in case collide (NTFS/APFS)
+        if os.path.lexists(os.path.join(parent, new_name)):
+            out.append(f"  Warning: '{new_name}' already exists. Would skip.")
+            # Suggest alternative filename in dry-run mode
+            alternative_name = get_alternative_filename(Path(parent, old_name), new_name)
+            out.append(f"  Alternative name would be: '{alternative_name}'")
+        if len(out) >= _OUTPUT_CHUNK:
+            _write_lines(out)
+    _write_lines(out)
+    _clear_dir_caches()
+    
+    # Files with an existing target still count (they get an alternative name)
+    files_renamed = len(plan)
+    print(f"Dry run complete. {files_renamed} files would be renamed.")
+    if files_renamed > 0:
+        if get_user_confirmation("Proceed with renaming these files?"):
+            files_renamed = _apply_plan(plan, verbose, serial=serial)
             print(f"Complete. {files_renamed} files renamed.")
 
-def main():
+def _replacement_help():
+    """List the ASCII entries of CHAR_MAP for the --help epilog."""
+    return '\n'.join(
+        f"  {'space' if char == ' ' else char} -> {replacement}"
+        for char, replacement in CHAR_MAP.items() if char.isascii()
+    )
+
+def _build_parser():
+    """Build the full argparse parser, used for --help and unusual command lines."""
+    import argparse
+    
     parser = argparse.ArgumentParser(
         description='Rename files by replacing problematic characters.',
         formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
+        epilog=f"""
 Character replacements:
-  : -> _
-  , -> -
-  space -> -
-  ; -> _
-  ? -> _
-  < -> _
-  > -> _
-  | -> _
-  " -> _
-  * -> _
-  / -> _
-  \\ -> _
+{_replacement_help()}
 
 Examples:
   %(prog)s .                    # Dry-run: show what would be renamed
@@ -220,14 +495,62 @@ Examples:
                         help='Actually rename files (default is dry-run)')
     parser.add_argument('-q', '--quiet', action='store_true',
                         help='Suppress output except errors')
+    parser.add_argument('-s', '--serial', action='store_true',
+                        help='Rename one file at a time (no thread pool)')
+    
+    return parser
+
+_Args = namedtuple('_Args', ['path', 'recursive', 'wet', 'quiet', 'serial'])
+
+# Flags understood by _parse_argv, mapped to their _Args field
+_FLAGS = {
+    '-r': 'recursive', '--recursive': 'recursive',
+    '-w': 'wet', '--wet': 'wet',
+    '-q': 'quiet', '--quiet': 'quiet',
+    '-s': 'serial', '--serial': 'serial',
+}
+
+def _parse_argv(argv):
+    """
+    Parse the usual command line shapes without building an argparse parser.
     
-    args = parser.parse_args()
+    Handles the boolean flags (including combined short flags such as -rw)
+    and one optional path. Returns None for anything else, including -h,
+    so the caller can fall back to argparse for help and error messages.
+    """
+    values = {'path': '.', 'recursive': False, 'wet': False, 'quiet': False, 'serial': False}
+    path_seen = False
+    
+    for arg in argv:
+        if arg in _FLAGS:
+            values[_FLAGS[arg]] = True
+        elif arg.startswith('--'):
+            return None
+        elif arg.startswith('-') and len(arg) > 1:
+            for char in arg[1:]:
+                field = _FLAGS.get(f"-{char}")
+                if field is None:
+                    return None
+                values[field] = True
+        elif path_seen:
+            return None
+        else:
+            values['path'] = arg
+            path_seen = True
+    
+    return _Args(**values)
+
+def main():
+    args = _parse_argv(sys.argv[1:])
+    if args is None:
+        args = _build_parser().parse_args()
     
     rename_files(
         path=args.path,
         recursive=args.recursive,
         dry_run=not args.wet,
-        verbose=not args.quiet
+        verbose=not args.quiet,
+        serial=args.serial
     )
 
 if __name__ == '__main__':